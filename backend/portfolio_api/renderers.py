@@ -0,0 +1,61 @@
+"""
+REST Framework renderers for portfolio_api.
+"""
+import math
+from decimal import Decimal
+
+import orjson
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+_fallback_encoder = JSONEncoder()
+
+
+def _has_non_finite(data):
+    """Whether data contains a NaN or infinite float/Decimal anywhere."""
+    if isinstance(data, float):
+        return not math.isfinite(data)
+    if isinstance(data, Decimal):
+        return not data.is_finite()
+    if isinstance(data, dict):
+        return any(map(_has_non_finite, data.values()))
+    if isinstance(data, (list, tuple)):
+        return any(map(_has_non_finite, data))
+    return False
+
+
+def _dumps(data):
+    """orjson-encode data, escaping U+2028/U+2029 like JSONRenderer does.
+    
+    orjson silently writes NaN/Infinity as null, so those raise ValueError
+    instead, as JSONRenderer does (STRICT_JSON). Only output containing null
+    is checked.
+    """
+    ret = orjson.dumps(data, default=_fallback_encoder.default, option=_OPTIONS)
+    if b'null' in ret and _has_non_finite(data):
+        raise ValueError('Out of range float values are not JSON compliant')
+    return ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+
+
+class ORJSONRenderer(JSONRenderer):
+    """JSONRenderer that encodes with orjson (C) instead of the stdlib json module.
+    
+    Values orjson does not handle natively (Decimal, datetimes, lazy strings, ...)
+    go through DRF's own JSONEncoder.default, so the output matches JSONRenderer.
+    Pretty-printing, NaN/Infinity and anything orjson rejects fall back to
+    JSONRenderer.
+    """
+    
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        
+        if self.ensure_ascii or self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+        
+        try:
+            return _dumps(data)
+        except (orjson.JSONEncodeError, ValueError):
+            # JSONRenderer then raises, or writes NaN/Infinity when STRICT_JSON is off
+            return super().render(data, accepted_media_type, renderer_context)
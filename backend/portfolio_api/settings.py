@@ -137,7 +137,7 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.AllowAny',
     ],
     'DEFAULT_RENDERER_CLASSES': [
-        'rest_framework.renderers.JSONRenderer',
+        'portfolio_api.renderers.ORJSONRenderer',
     ],
 }
 
@@ -177,6 +177,18 @@ MEDIA_URL = '/media/'
 DATA_DIR = os.path.join(BASE_DIR, 'data')
 os.makedirs(DATA_DIR, exist_ok=True)
 
+# Cache shared by every process on this host (server workers, manage.py
+# commands, the shell), so signal-based invalidation of cached users reaches
+# all of them. The default LocMemCache is per process. Point this at Redis
+# to share it across hosts.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache'),
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    }
+}
+
 # Media directories
 os.makedirs(os.path.join(MEDIA_ROOT, 'users'), exist_ok=True)
 os.makedirs(os.path.join(MEDIA_ROOT, 'brokerage_notes'), exist_ok=True)
@@ -0,0 +1,27 @@
+"""Tests for portfolio_api renderers."""
+from decimal import Decimal
+
+from django.test import SimpleTestCase
+from rest_framework.renderers import JSONRenderer
+
+from portfolio_api.renderers import ORJSONRenderer
+
+
+class ORJSONRendererTests(SimpleTestCase):
+    def test_matches_json_renderer(self):
+        data = {'name': 'Ação ', 'price': Decimal('1.50'), 'missing': None, 'values': [1, 2.5]}
+        self.assertEqual(ORJSONRenderer().render(data), JSONRenderer().render(data))
+
+    def test_non_finite_floats_rejected_like_json_renderer(self):
+        for value in (float('nan'), float('inf'), [1, {'x': float('-inf')}]):
+            with self.assertRaises(ValueError):
+                JSONRenderer().render({'value': value})
+            with self.assertRaises(ValueError):
+                ORJSONRenderer().render({'value': value})
+
+    def test_non_finite_floats_allowed_when_not_strict(self):
+        class LenientRenderer(ORJSONRenderer):
+            strict = False
+
+        self.assertEqual(LenientRenderer().render({'value': float('nan')}), b'{"value":NaN}')
+
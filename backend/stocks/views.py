@@ -18,6 +18,7 @@ class StockViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         queryset = Stock.objects.select_related('investment_type', 'investment_subtype').all()
         search = self.request.query_params.get('search')
+        tickers = self.request.query_params.get('tickers')
         investment_type_id = self.request.query_params.get('investment_type_id')
         investment_subtype_id = self.request.query_params.get('investment_subtype_id')
         financial_market = self.request.query_params.get('financial_market')
@@ -31,6 +32,11 @@ class StockViewSet(viewsets.ModelViewSet):
         
         if active_only:
             queryset = queryset.filter(is_active=True)
+        if tickers:
+            # Comma-separated list, so callers can fetch many stocks in one request
+            queryset = queryset.filter(
+                ticker__in=[ticker.strip() for ticker in tickers.split(',') if ticker.strip()]
+            )
         if search:
             queryset = queryset.filter(
                 models.Q(ticker__icontains=search) |
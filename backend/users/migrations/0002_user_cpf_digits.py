@@ -0,0 +1,29 @@
+# Generated by Django 5.2.8 on 2026-10-16
+
+import re
+
+from django.db import migrations, models
+
+
+def populate_cpf_digits(apps, schema_editor):
+    """Fill cpf_digits for existing users."""
+    User = apps.get_model('users', 'User')
+    for user in User.objects.all():
+        user.cpf_digits = re.sub(r'[^\d]', '', user.cpf or '')
+        user.save(update_fields=['cpf_digits'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='cpf_digits',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=11),
+        ),
+        migrations.RunPython(populate_cpf_digits, migrations.RunPython.noop),
+    ]
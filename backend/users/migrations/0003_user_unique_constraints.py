@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-16 10:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_user_cpf_digits'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='user',
+            name='cpf_digits',
+            field=models.CharField(blank=True, editable=False, max_length=11),
+        ),
+        migrations.AddConstraint(
+            model_name='user',
+            constraint=models.UniqueConstraint(fields=('cpf_digits',), name='uniq_user_cpf_digits'),
+        ),
+        migrations.AddConstraint(
+            model_name='user',
+            constraint=models.UniqueConstraint(fields=('account_number',), name='uniq_user_account_number'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+from django.db import migrations
+
+CONSTRAINT_NAME = 'users_cpf_digits_matches_cpf'
+
+
+def add_cpf_digits_check(apps, schema_editor):
+    """On PostgreSQL, make the database reject a cpf_digits that drifts from cpf.
+    
+    Only PostgreSQL can strip every non-digit in SQL (regexp_replace); other
+    backends rely on User.save() alone.
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        f"ALTER TABLE users ADD CONSTRAINT {CONSTRAINT_NAME} "
+        f"CHECK (cpf_digits = regexp_replace(cpf, '\\D', '', 'g'))"
+    )
+
+
+def remove_cpf_digits_check(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(f"ALTER TABLE users DROP CONSTRAINT {CONSTRAINT_NAME}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_user_unique_constraints'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_cpf_digits_check, remove_cpf_digits_check),
+    ]
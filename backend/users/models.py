@@ -1,15 +1,22 @@
 """
 Django models for users app.
 """
+import re
 import uuid
 from django.db import models
 
+# Compiled once; the single definition of CPF normalization (also used by services)
+CPF_NON_DIGITS = re.compile(r'[^\d]')
+
 
 class User(models.Model):
     """User model for storing user information."""
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     name = models.CharField(max_length=255)
     cpf = models.CharField(max_length=20)
+    # Normalized CPF for indexed uniqueness lookups, kept in sync by save()
+    # (on PostgreSQL a CHECK constraint also rejects any drift from cpf)
+    cpf_digits = models.CharField(max_length=11, blank=True, editable=False)
     account_provider = models.CharField(max_length=255)
     account_number = models.CharField(max_length=100)
     picture = models.CharField(max_length=500, null=True, blank=True)
@@ -19,6 +26,18 @@ class User(models.Model):
     class Meta:
         db_table = 'users'
         ordering = ['name']
+        constraints = [
+            models.UniqueConstraint(fields=['cpf_digits'], name='uniq_user_cpf_digits'),
+            models.UniqueConstraint(fields=['account_number'], name='uniq_user_account_number'),
+        ]
 
     def __str__(self):
         return f"{self.name} ({self.cpf})"
+
+    def save(self, *args, **kwargs):
+        # Keep the normalized CPF in sync so uniqueness checks can hit the index
+        self.cpf_digits = CPF_NON_DIGITS.sub('', self.cpf or '')
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'cpf' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'cpf_digits'}
+        super().save(*args, **kwargs)
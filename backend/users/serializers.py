@@ -1,38 +1,88 @@
 """
 Django REST Framework serializers for users.
 """
+import operator
 import re
+from functools import cached_property
+from PIL import Image
 from rest_framework import serializers
 from django.core.files.uploadedfile import InMemoryUploadedFile
 from .services import UserJsonStorageService
 
 
+_CPF_WEIGHTS = range(10, 1, -1)
+_ACCOUNT_NUMBER_RE = re.compile(r'\A[A-Za-z0-9\-]+\Z')
+
+
 def validate_cpf_checksum(cpf: str) -> bool:
     """Validate Brazilian CPF checksum algorithm."""
     # Remove formatting
-    cpf_digits = re.sub(r'[^\d]', '', cpf)
+    cpf_digits = UserJsonStorageService.normalize_cpf(cpf)
     
     if len(cpf_digits) != 11:
         return False
     
     # Check if all digits are the same (invalid CPF)
-    if len(set(cpf_digits)) == 1:
+    if cpf_digits == cpf_digits[0] * 11:
         return False
     
-    # Calculate first check digit
-    sum_val = sum(int(cpf_digits[i]) * (10 - i) for i in range(9))
+    digits = list(map(int, cpf_digits))
+    
+    # Calculate first check digit (weights 10..2)
+    sum_val = sum(map(operator.mul, digits[:9], _CPF_WEIGHTS))
     remainder = sum_val % 11
     first_digit = 0 if remainder < 2 else 11 - remainder
     
-    if int(cpf_digits[9]) != first_digit:
+    if digits[9] != first_digit:
         return False
     
-    # Calculate second check digit
-    sum_val = sum(int(cpf_digits[i]) * (11 - i) for i in range(10))
+    # Second check digit uses weights 11..2: that is the first sum plus the
+    # plain sum of the first nine digits plus twice the first check digit
+    sum_val += sum(digits[:9]) + 2 * digits[9]
     remainder = sum_val % 11
     second_digit = 0 if remainder < 2 else 11 - remainder
     
-    return int(cpf_digits[10]) == second_digit
+    return digits[10] == second_digit
+
+
+def _prefetch_key(value):
+    """Coerce a raw list item value like CharField does; None if it cannot be prefetched."""
+    if isinstance(value, bool) or not isinstance(value, (str, int, float)):
+        return None
+    return str(value).strip() or None
+
+
+class UserListSerializer(serializers.ListSerializer):
+    """List serializer that prefetches existing CPFs/account numbers in bulk.
+    
+    Without this, validating N users issues 2*N uniqueness queries. The
+    lookups live on this serializer (the caller's context is left alone) and
+    also track values already seen in the batch, so repeats are rejected.
+    """
+    
+    _uniqueness = None
+    
+    def to_internal_value(self, data):
+        self._uniqueness = None
+        if isinstance(data, list):
+            items = [item for item in data if isinstance(item, dict)]
+            cpfs = {
+                UserJsonStorageService.normalize_cpf(key)
+                for key in (_prefetch_key(item.get('cpf')) for item in items) if key
+            }
+            account_numbers = {
+                key for key in (_prefetch_key(item.get('account_number')) for item in items) if key
+            }
+            # field -> (values queried, values already registered, values seen in this batch)
+            self._uniqueness = {
+                'cpf': (cpfs, UserJsonStorageService.get_existing_cpf_digits(cpfs), set()),
+                'account_number': (
+                    account_numbers,
+                    UserJsonStorageService.get_existing_account_numbers(account_numbers),
+                    set(),
+                ),
+            }
+        return super().to_internal_value(data)
 
 
 class UserSerializer(serializers.Serializer):
@@ -43,14 +93,48 @@ class UserSerializer(serializers.Serializer):
     cpf = serializers.CharField(max_length=14, required=True)
     account_provider = serializers.CharField(max_length=100, required=True)
     account_number = serializers.CharField(max_length=50, required=True)
-    picture = serializers.ImageField(required=False, allow_null=True)
+    picture = serializers.FileField(required=False, allow_null=True)
     created_at = serializers.DateTimeField(read_only=True)
     updated_at = serializers.DateTimeField(read_only=True)
     
+    class Meta:
+        list_serializer_class = UserListSerializer
+    
+    @cached_property
+    def _writable_fields(self):
+        """Writable fields, computed once; list validation reuses this child for every item."""
+        return [field for field in self.fields.values() if not field.read_only]
+    
+    def _get_exclude_user_id(self):
+        """Get the user ID to exclude from uniqueness checks (for updates)."""
+        if self.context:
+            return self.context.get('exclude_user_id')
+        if self.instance:
+            # If instance exists, it's an update - exclude current user
+            return self.instance.get('id') if isinstance(self.instance, dict) else None
+        return None
+    
+    def _check_unique(self, field_name, value, exists, taken_message, duplicate_message):
+        """Raise if value is already registered or, in a list, repeated earlier in the batch."""
+        uniqueness = getattr(self.parent, '_uniqueness', None)
+        if uniqueness is None:
+            is_taken = exists(value, exclude_user_id=self._get_exclude_user_id())
+        else:
+            queried, existing, seen = uniqueness[field_name]
+            if value in seen:
+                raise serializers.ValidationError(duplicate_message)
+            seen.add(value)
+            if value in queried:
+                is_taken = value in existing
+            else:
+                is_taken = exists(value, exclude_user_id=self._get_exclude_user_id())
+        if is_taken:
+            raise serializers.ValidationError(taken_message)
+    
     def validate_cpf(self, value: str) -> str:
         """Validate CPF format, checksum, and uniqueness."""
         # Remove formatting
-        cpf_digits = re.sub(r'[^\d]', '', value)
+        cpf_digits = UserJsonStorageService.normalize_cpf(value)
         
         # Check length
         if len(cpf_digits) != 11:
@@ -64,45 +148,39 @@ class UserSerializer(serializers.Serializer):
             raise serializers.ValidationError("Invalid CPF checksum")
         
         # Check uniqueness
-        # Get exclude_user_id from context if available (for updates)
-        exclude_user_id = None
-        if hasattr(self, 'context') and self.context:
-            exclude_user_id = self.context.get('exclude_user_id')
-        elif hasattr(self, 'instance') and self.instance:
-            # If instance exists, it's an update - exclude current user
-            exclude_user_id = self.instance.get('id') if isinstance(self.instance, dict) else None
-        
-        existing_user = UserJsonStorageService.get_user_by_cpf(formatted_cpf, exclude_user_id=exclude_user_id)
-        if existing_user:
-            raise serializers.ValidationError("CPF já cadastrado")
+        self._check_unique(
+            'cpf', cpf_digits, UserJsonStorageService.cpf_exists,
+            "CPF já cadastrado", "CPF duplicado na lista"
+        )
         
         return formatted_cpf
     
     def validate_account_number(self, value: str) -> str:
         """Validate account number format and uniqueness."""
-        if not re.match(r'^[A-Za-z0-9\-]+$', value):
+        if not _ACCOUNT_NUMBER_RE.match(value):
             raise serializers.ValidationError("Account number must be alphanumeric")
         
         # Check uniqueness
-        # Get exclude_user_id from context if available (for updates)
-        exclude_user_id = None
-        if hasattr(self, 'context') and self.context:
-            exclude_user_id = self.context.get('exclude_user_id')
-        elif hasattr(self, 'instance') and self.instance:
-            # If instance exists, it's an update - exclude current user
-            exclude_user_id = self.instance.get('id') if isinstance(self.instance, dict) else None
-        
-        existing_user = UserJsonStorageService.get_user_by_account_number(value, exclude_user_id=exclude_user_id)
-        if existing_user:
-            raise serializers.ValidationError("Número da conta já cadastrado")
+        self._check_unique(
+            'account_number', value, UserJsonStorageService.account_number_exists,
+            "Número da conta já cadastrado", "Número da conta duplicado na lista"
+        )
         
         return value
     
     def validate_picture(self, value: InMemoryUploadedFile) -> InMemoryUploadedFile:
-        """Validate picture file."""
+        """Validate picture file.
+        
+        Cheap size/content-type checks run before Pillow touches the file.
+        """
         if value is None:
             return value
         
+        # Check file size (5MB max)
+        max_size = 5 * 1024 * 1024  # 5MB in bytes
+        if value.size > max_size:
+            raise serializers.ValidationError("File size exceeds 5MB")
+        
         # Check file type
         allowed_types = ['image/jpeg', 'image/png', 'image/jpg']
         if value.content_type not in allowed_types:
@@ -110,10 +188,15 @@ class UserSerializer(serializers.Serializer):
                 f"Invalid file type. Allowed types: {', '.join(allowed_types)}"
             )
         
-        # Check file size (5MB max)
-        max_size = 5 * 1024 * 1024  # 5MB in bytes
-        if value.size > max_size:
-            raise serializers.ValidationError("File size exceeds 5MB")
+        # Only now verify the image structure with Pillow
+        try:
+            value.seek(0)
+            Image.open(value).verify()
+        except Exception:
+            raise serializers.ValidationError(
+                "Upload a valid image. The file you uploaded was either not an image or a corrupted image."
+            )
+        finally:
+            value.seek(0)
         
         return value
-
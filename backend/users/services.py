@@ -1,52 +1,151 @@
 """
 Service for managing user data using Django ORM.
 """
-import re
+import logging
 import uuid
-from typing import List, Dict, Optional
-from .models import User
+from functools import lru_cache
+from types import MappingProxyType
+from typing import List, Dict, Optional, Set
+from django.core.cache import cache
+from django.db import transaction
+from .models import CPF_NON_DIGITS, User
+
+logger = logging.getLogger(__name__)
+
+# Serialized user dicts are cached per user and invalidated by signals on save/delete
+USER_CACHE_TIMEOUT = 3600
+
+# Bumped on every user save/delete; the in-process load_users() result is reused
+# while it is unchanged (one cache read instead of a query per call). The token
+# lives in the shared cache (settings.CACHES), so a save in any process
+# refreshes every process's list.
+USERS_VERSION_KEY = 'users:version'
+_users_list_cache = (None, [])
+
+# Columns exposed by the API; fetched with .values() to skip model instantiation
+USER_FIELDS = (
+    'id', 'name', 'cpf', 'account_provider', 'account_number', 'picture',
+    'created_at', 'updated_at',
+)
+USER_EDITABLE_FIELDS = ('name', 'cpf', 'account_provider', 'account_number', 'picture')
 
 
 class UserJsonStorageService:
     """Service for managing user data using Django ORM."""
     
     @staticmethod
-    def get_users_file_path():
-        """Legacy method - kept for backward compatibility."""
-        # This method is no longer used but kept for compatibility
-        pass
+    def cache_key(user_id) -> str:
+        """Cache key for a serialized user dict."""
+        return f'user:{user_id}:v1'
+    
+    @staticmethod
+    def parse_user_id(user_id) -> Optional[uuid.UUID]:
+        """Parse a user ID from the URL into a UUID, or None if it is not one.
+        
+        Cache keys are built from the canonical form, matching the keys the
+        signals invalidate, however the client spelled the ID.
+        """
+        if isinstance(user_id, uuid.UUID):
+            return user_id
+        try:
+            return uuid.UUID(user_id)
+        except (TypeError, ValueError, AttributeError):
+            return None
+    
+    @staticmethod
+    def get_user_ids_queryset():
+        """Ordered queryset of user IDs, suitable for LIMIT/OFFSET pagination."""
+        return User.objects.order_by('name', 'id').values_list('id', flat=True)
+    
+    @staticmethod
+    def get_users_version() -> str:
+        """Current version token of the users table."""
+        version = cache.get(USERS_VERSION_KEY)
+        if version is None:
+            cache.add(USERS_VERSION_KEY, uuid.uuid4().hex, timeout=None)
+            version = cache.get(USERS_VERSION_KEY)
+        return version
+    
+    @staticmethod
+    def bump_users_version() -> None:
+        """Invalidate cached user lists (called when any user changes)."""
+        cache.set(USERS_VERSION_KEY, uuid.uuid4().hex, timeout=None)
     
     @staticmethod
     def load_users() -> List[Dict]:
-        """Load all users from database."""
-        return [
-            UserJsonStorageService._user_to_dict(user)
-            for user in User.objects.all()
-        ]
-    
-    @staticmethod
-    def save_users(users: List[Dict]) -> None:
-        """Save users list to database."""
-        for user_data in users:
-            User.objects.update_or_create(
-                id=user_data.get('id'),
-                defaults={
-                    'name': user_data.get('name', ''),
-                    'cpf': user_data.get('cpf', ''),
-                    'account_provider': user_data.get('account_provider', ''),
-                    'account_number': user_data.get('account_number', ''),
-                    'picture': user_data.get('picture'),
-                }
+        """Load all users from database (reused in-process until a user changes)."""
+        global _users_list_cache
+        version = UserJsonStorageService.get_users_version()
+        cached_version, users = _users_list_cache
+        if cached_version != version:
+            users = UserJsonStorageService.get_users_by_ids(
+                UserJsonStorageService.get_user_ids_queryset()
             )
+            _users_list_cache = (version, users)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("load_users returning %d rows", len(users))
+        # Copies, so callers cannot alter the shared list
+        return [dict(user) for user in users]
+    
+    @staticmethod
+    def get_users_by_ids(user_ids) -> List[Dict]:
+        """Get users for the given IDs (in order), serving cached dicts and only
+        fetching misses from the database."""
+        user_ids = [_uuid_to_str(user_id) for user_id in user_ids]
+        keys = [UserJsonStorageService.cache_key(user_id) for user_id in user_ids]
+        cached = cache.get_many(keys)
+        
+        missing_ids = [user_id for user_id, key in zip(user_ids, keys) if key not in cached]
+        if missing_ids:
+            rows = User.objects.filter(id__in=missing_ids).values(*USER_FIELDS)
+            fetched = {
+                UserJsonStorageService.cache_key(row['id']): UserJsonStorageService._user_to_dict(row)
+                for row in rows.iterator(chunk_size=500)
+            }
+            cache.set_many(fetched, timeout=USER_CACHE_TIMEOUT)
+            cached.update(fetched)
+        
+        return [cached[key] for key in keys if key in cached]
+    
+    @staticmethod
+    def create_user(user_data: Dict) -> Dict:
+        """Insert a single user and return it as a dictionary."""
+        user = User.objects.create(
+            id=user_data['id'],
+            **{field: user_data.get(field) for field in USER_EDITABLE_FIELDS if field in user_data},
+        )
+        return UserJsonStorageService._instance_to_dict(user)
+    
+    @staticmethod
+    def update_user(user_id: str, changes: Dict) -> Optional[Dict]:
+        """Apply changes to a single user atomically and return it, or None if missing."""
+        changes = {field: value for field, value in changes.items() if field in USER_EDITABLE_FIELDS}
+        with transaction.atomic():
+            user = User.objects.select_for_update().filter(id=user_id).first()
+            if user is None:
+                return None
+            for field, value in changes.items():
+                setattr(user, field, value)
+            user.save(update_fields=[*changes, 'updated_at'])
+        return UserJsonStorageService._instance_to_dict(user)
     
     @staticmethod
     def get_user_by_id(user_id: str) -> Optional[Dict]:
-        """Get user by ID."""
-        try:
-            user = User.objects.get(id=user_id)
-            return UserJsonStorageService._user_to_dict(user)
-        except User.DoesNotExist:
+        """Get user by ID (None when missing or not a valid UUID)."""
+        user_id = UserJsonStorageService.parse_user_id(user_id)
+        if user_id is None:
+            return None
+        key = UserJsonStorageService.cache_key(user_id)
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+        
+        row = User.objects.filter(id=user_id).values(*USER_FIELDS).first()
+        if row is None:
             return None
+        user = UserJsonStorageService._user_to_dict(row)
+        cache.set(key, user, timeout=USER_CACHE_TIMEOUT)
+        return user
     
     @staticmethod
     def user_exists(user_id: str) -> bool:
@@ -55,13 +154,13 @@ class UserJsonStorageService:
     
     @staticmethod
     def generate_user_id() -> str:
-        """Generate unique UUID for user."""
+        """Generate unique UUID for user (random, in-process; no database lookup)."""
         return str(uuid.uuid4())
     
     @staticmethod
     def normalize_cpf(cpf: str) -> str:
         """Normalize CPF by removing formatting (dots and dashes)."""
-        return re.sub(r'[^\d]', '', cpf)
+        return CPF_NON_DIGITS.sub('', cpf)
     
     @staticmethod
     def get_user_by_cpf(cpf: str, exclude_user_id: Optional[str] = None) -> Optional[Dict]:
@@ -74,17 +173,12 @@ class UserJsonStorageService:
         Returns:
             User dict if found, None otherwise
         """
-        normalized_cpf = UserJsonStorageService.normalize_cpf(cpf)
-        users = User.objects.all()
-        
-        for user in users:
-            if exclude_user_id and str(user.id) == exclude_user_id:
-                continue
-            user_cpf = user.cpf or ''
-            if UserJsonStorageService.normalize_cpf(user_cpf) == normalized_cpf:
-                return UserJsonStorageService._user_to_dict(user)
+        queryset = User.objects.filter(cpf_digits=UserJsonStorageService.normalize_cpf(cpf))
+        if exclude_user_id:
+            queryset = queryset.exclude(id=exclude_user_id)
         
-        return None
+        row = queryset.values(*USER_FIELDS).first()
+        return UserJsonStorageService._user_to_dict(row) if row else None
     
     @staticmethod
     def get_user_by_account_number(account_number: str, exclude_user_id: Optional[str] = None) -> Optional[Dict]:
@@ -101,25 +195,72 @@ class UserJsonStorageService:
         if exclude_user_id:
             queryset = queryset.exclude(id=exclude_user_id)
         
-        try:
-            user = queryset.first()
-            if user:
-                return UserJsonStorageService._user_to_dict(user)
-        except Exception:
-            pass
-        
-        return None
-    
-    @staticmethod
-    def _user_to_dict(user: User) -> Dict:
-        """Convert User model instance to dictionary."""
-        return {
-            'id': str(user.id),
-            'name': user.name,
-            'cpf': user.cpf,
-            'account_provider': user.account_provider,
-            'account_number': user.account_number,
-            'picture': user.picture,
-            'created_at': user.created_at.isoformat() if user.created_at else None,
-            'updated_at': user.updated_at.isoformat() if user.updated_at else None,
-        }
+        row = queryset.values(*USER_FIELDS).first()
+        return UserJsonStorageService._user_to_dict(row) if row else None
+    
+    @staticmethod
+    def cpf_exists(cpf: str, exclude_user_id: Optional[str] = None) -> bool:
+        """Check if another user already has this CPF (single indexed query)."""
+        queryset = User.objects.filter(cpf_digits=UserJsonStorageService.normalize_cpf(cpf))
+        if exclude_user_id:
+            queryset = queryset.exclude(id=exclude_user_id)
+        return queryset.exists()
+    
+    @staticmethod
+    def account_number_exists(account_number: str, exclude_user_id: Optional[str] = None) -> bool:
+        """Check if another user already has this account number (single query)."""
+        queryset = User.objects.filter(account_number=account_number)
+        if exclude_user_id:
+            queryset = queryset.exclude(id=exclude_user_id)
+        return queryset.exists()
+    
+    @staticmethod
+    def get_existing_cpf_digits(cpfs: List[str]) -> Set[str]:
+        """Return the normalized CPFs from the given list that are already registered."""
+        digits = {UserJsonStorageService.normalize_cpf(cpf) for cpf in cpfs}
+        return set(
+            User.objects.filter(cpf_digits__in=digits).values_list('cpf_digits', flat=True)
+        )
+    
+    @staticmethod
+    def get_existing_account_numbers(account_numbers: List[str]) -> Set[str]:
+        """Return the account numbers from the given list that are already registered."""
+        return set(
+            User.objects.filter(account_number__in=set(account_numbers))
+            .values_list('account_number', flat=True)
+        )
+    
+    @staticmethod
+    def _instance_to_dict(user: User) -> Dict:
+        """Convert a freshly saved User instance to a dictionary."""
+        return UserJsonStorageService._user_to_dict({field: getattr(user, field) for field in USER_FIELDS})
+    
+    @staticmethod
+    def _user_to_dict(row: Dict) -> Dict:
+        """Convert a User values() row to a JSON-ready dictionary."""
+        # Copy: the memoized mapping is shared and callers mutate the result
+        return dict(_serialize_user(*(row[field] for field in USER_FIELDS)))
+
+
+@lru_cache(maxsize=1024)
+def _serialize_user(user_id, name, cpf, account_provider, account_number, picture,
+                    created_at, updated_at) -> MappingProxyType:
+    """Memoized conversion of a user row; a changed row (new updated_at) is a new key."""
+    return MappingProxyType({
+        'id': _uuid_to_str(user_id),
+        'name': name,
+        'cpf': cpf,
+        'account_provider': account_provider,
+        'account_number': account_number,
+        'picture': picture,
+        'created_at': created_at.isoformat() if created_at else None,
+        'updated_at': updated_at.isoformat() if updated_at else None,
+    })
+
+
+def _uuid_to_str(value) -> str:
+    """Canonical 8-4-4-4-12 form of a UUID, built from .hex (cheaper than str(UUID))."""
+    if isinstance(value, str):
+        return value
+    h = value.hex
+    return f"{h[:8]}-{h[8:12]}-{h[12:16]}-{h[16:20]}-{h[20:]}"
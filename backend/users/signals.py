@@ -0,0 +1,27 @@
+"""
+Signal handlers for users app.
+"""
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import User
+from .services import UserJsonStorageService
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_user_cache(sender, instance, using, **kwargs):
+    """Drop the cached serialized dict and cached user lists when a user changes.
+    
+    Deferred until the change commits; otherwise a concurrent read between the
+    save and the commit would re-cache the old row under the new version.
+    """
+    key = UserJsonStorageService.cache_key(instance.id)
+    
+    def invalidate():
+        cache.delete(key)
+        UserJsonStorageService.bump_users_version()
+    
+    transaction.on_commit(invalidate, using=using)
@@ -0,0 +1,406 @@
+"""Tests for users app."""
+import io
+import shutil
+import tempfile
+from unittest.mock import patch
+
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from PIL import Image
+
+from users.models import User
+from users.serializers import UserSerializer, validate_cpf_checksum
+from users import services as users_services
+from users.services import UserJsonStorageService
+
+
+class UserTestCase(TestCase):
+    """Cached user data outlives the per-test rollback, so start each test clean."""
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+
+class CpfChecksumTests(TestCase):
+    def test_valid_cpfs(self):
+        self.assertTrue(validate_cpf_checksum('529.982.247-25'))
+        self.assertTrue(validate_cpf_checksum('11144477735'))
+
+    def test_invalid_check_digits(self):
+        self.assertFalse(validate_cpf_checksum('529.982.247-24'))
+        self.assertFalse(validate_cpf_checksum('529.982.247-15'))
+
+    def test_repeated_digits_and_wrong_length(self):
+        self.assertFalse(validate_cpf_checksum('111.111.111-11'))
+        self.assertFalse(validate_cpf_checksum('5299822472'))
+
+
+class UserUniquenessValidationTests(UserTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create(
+            name='Existing User',
+            cpf='529.982.247-25',
+            account_provider='XP Investimentos',
+            account_number='12345-6',
+        )
+
+    def _payload(self, **overrides):
+        data = {
+            'name': 'New User',
+            'cpf': '111.444.777-35',
+            'account_provider': 'XP Investimentos',
+            'account_number': '99999-9',
+        }
+        data.update(overrides)
+        return data
+
+    def test_database_populates_cpf_digits(self):
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.cpf_digits, '52998224725')
+
+    def test_cpf_digits_strips_every_non_digit(self):
+        user = User.objects.create(
+            name='Odd Formatting',
+            cpf='(111)444777-35',
+            account_provider='XP Investimentos',
+            account_number='55555-5',
+        )
+        user.refresh_from_db()
+        self.assertEqual(user.cpf_digits, '11144477735')
+        self.assertTrue(UserJsonStorageService.cpf_exists('111.444.777-35'))
+        serializer = UserSerializer(data=self._payload(cpf='111.444.777-35'))
+        self.assertFalse(serializer.is_valid())
+        self.assertIn('cpf', serializer.errors)
+
+    def test_update_user_keeps_cpf_digits_in_sync(self):
+        UserJsonStorageService.update_user(str(self.user.id), {'cpf': '111.444.777-35'})
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.cpf_digits, '11144477735')
+
+    def test_duplicate_cpf_rejected_regardless_of_formatting(self):
+        serializer = UserSerializer(data=self._payload(cpf='52998224725'))
+        self.assertFalse(serializer.is_valid())
+        self.assertIn('cpf', serializer.errors)
+
+    def test_update_excludes_current_user(self):
+        serializer = UserSerializer(
+            data={'cpf': '529.982.247-25', 'account_number': '12345-6'},
+            partial=True,
+            context={'exclude_user_id': str(self.user.id)},
+        )
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+
+    def test_list_validation_uses_single_prefetch(self):
+        data = [
+            self._payload(),
+            self._payload(cpf='529.982.247-25', account_number='12345-6'),
+        ]
+        serializer = UserSerializer(data=data, many=True)
+        with self.assertNumQueries(2):
+            self.assertFalse(serializer.is_valid())
+        self.assertIn('cpf', serializer.errors[1])
+        self.assertIn('account_number', serializer.errors[1])
+
+    def test_list_validation_accepts_non_string_values(self):
+        serializer = UserSerializer(data=[self._payload(cpf=52998224725, account_number=99999)], many=True)
+        self.assertFalse(serializer.is_valid())
+        self.assertIn('cpf', serializer.errors[0])
+        serializer = UserSerializer(data=[self._payload(cpf=11144477735, account_number=999999)], many=True)
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+
+    def test_list_validation_leaves_context_untouched(self):
+        context = {}
+        serializer = UserSerializer(data=[self._payload()], many=True, context=context)
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        self.assertEqual(context, {})
+
+    def test_list_validation_rejects_duplicates_within_batch(self):
+        data = [
+            self._payload(),
+            self._payload(cpf='11144477735', account_number='99999-9'),
+        ]
+        serializer = UserSerializer(data=data, many=True)
+        self.assertFalse(serializer.is_valid())
+        self.assertNotIn(0, serializer.errors)
+        self.assertIn('cpf', serializer.errors[1])
+        self.assertIn('account_number', serializer.errors[1])
+
+
+class UserCacheTests(UserTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create(
+            name='Cached User',
+            cpf='529.982.247-25',
+            account_provider='XP Investimentos',
+            account_number='12345-6',
+        )
+
+    def test_get_user_by_id_served_from_cache(self):
+        UserJsonStorageService.get_user_by_id(str(self.user.id))
+        with self.assertNumQueries(0):
+            user = UserJsonStorageService.get_user_by_id(str(self.user.id))
+        self.assertEqual(user['name'], 'Cached User')
+
+    def test_save_invalidates_cache(self):
+        UserJsonStorageService.get_user_by_id(str(self.user.id))
+        self.user.name = 'Renamed User'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save()
+        self.assertEqual(UserJsonStorageService.get_user_by_id(str(self.user.id))['name'], 'Renamed User')
+        self.assertEqual(UserJsonStorageService.load_users()[0]['name'], 'Renamed User')
+
+    def test_cache_invalidated_only_after_commit(self):
+        UserJsonStorageService.get_user_by_id(str(self.user.id))
+        self.user.name = 'Renamed User'
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            self.user.save()
+            # A read before the commit must not be able to re-cache the old row
+            self.assertEqual(UserJsonStorageService.get_user_by_id(str(self.user.id))['name'], 'Cached User')
+        for callback in callbacks:
+            callback()
+        self.assertEqual(UserJsonStorageService.get_user_by_id(str(self.user.id))['name'], 'Renamed User')
+
+    def test_signal_deletes_key_in_shared_cache(self):
+        # Another process sees the configured backend through its own connection
+        self.assertNotIsInstance(cache, LocMemCache)
+        other_process_cache = caches.create_connection('default')
+        key = UserJsonStorageService.cache_key(self.user.id)
+        other_process_cache.set(key, {'name': 'Stale'})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save()
+        self.assertIsNone(other_process_cache.get(key))
+
+    def test_non_canonical_id_shares_invalidated_cache_entry(self):
+        url = f'/api/users/{str(self.user.id).upper()}/'
+        self.assertEqual(self.client.get(url).json()['name'], 'Cached User')
+        self.user.name = 'Renamed User'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save()
+        self.assertEqual(self.client.get(url).json()['name'], 'Renamed User')
+
+    def test_invalid_id_is_not_found(self):
+        for method in (self.client.get, self.client.put, self.client.delete):
+            response = method('/api/users/not-a-uuid/', content_type='application/json')
+            self.assertEqual(response.status_code, 404, method)
+
+    def test_load_users_refreshed_after_out_of_process_change(self):
+        UserJsonStorageService.load_users()
+        # Simulate another process: its save invalidates through its own cache connection
+        User.objects.filter(id=self.user.id).update(name='Renamed Elsewhere')
+        other_process_cache = caches.create_connection('default')
+        other_process_cache.delete(UserJsonStorageService.cache_key(self.user.id))
+        other_process_cache.set(users_services.USERS_VERSION_KEY, 'other-process', timeout=None)
+        self.assertEqual(UserJsonStorageService.load_users()[0]['name'], 'Renamed Elsewhere')
+
+    def test_load_users_reused_until_a_user_changes(self):
+        UserJsonStorageService.load_users()
+        with self.assertNumQueries(0):
+            UserJsonStorageService.load_users()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.delete()
+        self.assertEqual(UserJsonStorageService.load_users(), [])
+
+
+class UserListPaginationTests(UserTestCase):
+    def setUp(self):
+        super().setUp()
+        for i, (cpf, account) in enumerate([('529.982.247-25', '1'), ('111.444.777-35', '2')]):
+            User.objects.create(
+                name=f'User {i}', cpf=cpf, account_provider='XP', account_number=account,
+            )
+
+    def test_list_without_limit_returns_plain_list(self):
+        response = self.client.get('/api/users/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), 2)
+
+    def test_list_with_limit_is_paginated(self):
+        response = self.client.get('/api/users/', {'limit': 1, 'offset': 1})
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual(body['count'], 2)
+        self.assertEqual([u['name'] for u in body['results']], ['User 1'])
+
+
+class UserPictureValidationTests(TestCase):
+    def _upload(self, content, content_type='image/png', name='avatar.png'):
+        return SimpleUploadedFile(name, content, content_type=content_type)
+
+    def test_valid_png_accepted(self):
+        buffer = io.BytesIO()
+        Image.new('RGB', (1, 1)).save(buffer, format='PNG')
+        serializer = UserSerializer(data={'picture': self._upload(buffer.getvalue())}, partial=True)
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+
+    def test_wrong_content_type_rejected(self):
+        serializer = UserSerializer(
+            data={'picture': self._upload(b'GIF89a', content_type='image/gif', name='a.gif')},
+            partial=True,
+        )
+        self.assertFalse(serializer.is_valid())
+        self.assertIn('picture', serializer.errors)
+
+    def test_oversized_rejected_before_decoding(self):
+        serializer = UserSerializer(data={'picture': self._upload(b'0' * (5 * 1024 * 1024 + 1))}, partial=True)
+        with patch('users.serializers.Image.open') as image_open:
+            self.assertFalse(serializer.is_valid())
+        image_open.assert_not_called()
+        self.assertEqual(serializer.errors['picture'], ['File size exceeds 5MB'])
+
+    def test_corrupted_image_rejected(self):
+        serializer = UserSerializer(data={'picture': self._upload(b'not an image')}, partial=True)
+        self.assertFalse(serializer.is_valid())
+        self.assertIn('picture', serializer.errors)
+
+
+class UserDetailConditionalGetTests(UserTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create(
+            name='Conditional User',
+            cpf='529.982.247-25',
+            account_provider='XP Investimentos',
+            account_number='12345-6',
+        )
+        self.url = f'/api/users/{self.user.id}/'
+
+    def test_get_sets_validators(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.has_header('ETag'))
+        self.assertTrue(response.has_header('Last-Modified'))
+
+    def test_matching_etag_returns_not_modified(self):
+        etag = self.client.get(self.url)['ETag']
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_cached_revalidation_runs_no_queries(self):
+        etag = self.client.get(self.url)['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_etag_changes_after_update(self):
+        etag = self.client.get(self.url)['ETag']
+        self.user.name = 'Updated'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['name'], 'Updated')
+
+
+class UserDetailUpdateTests(UserTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create(
+            name='Before',
+            cpf='529.982.247-25',
+            account_provider='XP Investimentos',
+            account_number='12345-6',
+        )
+        self.other = User.objects.create(
+            name='Other',
+            cpf='111.444.777-35',
+            account_provider='XP Investimentos',
+            account_number='99999-9',
+        )
+
+    def test_put_updates_only_target_user(self):
+        response = self.client.put(
+            f'/api/users/{self.user.id}/',
+            data={'name': 'After'},
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['name'], 'After')
+        self.user.refresh_from_db()
+        self.other.refresh_from_db()
+        self.assertEqual(self.user.name, 'After')
+        self.assertEqual(self.other.name, 'Other')
+
+
+class UserCreateTests(UserTestCase):
+    def setUp(self):
+        super().setUp()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+
+    def test_post_saves_uploaded_picture(self):
+        buffer = io.BytesIO()
+        Image.new('RGB', (1, 1)).save(buffer, format='PNG')
+        picture = SimpleUploadedFile('avatar.png', buffer.getvalue(), content_type='image/png')
+        with override_settings(MEDIA_ROOT=self.media_root):
+            response = self.client.post('/api/users/', {
+                'name': 'New User',
+                'cpf': '529.982.247-25',
+                'account_provider': 'XP Investimentos',
+                'account_number': '12345-6',
+                'picture': picture,
+            })
+            self.assertEqual(response.status_code, 201, response.content)
+            picture_path = response.json()['picture'].removeprefix('/media/')
+            with open(f'{self.media_root}/{picture_path}', 'rb') as saved:
+                self.assertEqual(saved.read(), buffer.getvalue())
+
+    def test_post_schedules_default_strategy_after_commit(self):
+        with patch('users.views._create_default_strategy') as create_strategy, \
+                patch('users.views.threading.Thread', side_effect=_InlineThread):
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post('/api/users/', {
+                    'name': 'New User',
+                    'cpf': '529.982.247-25',
+                    'account_provider': 'XP Investimentos',
+                    'account_number': '12345-6',
+                })
+        self.assertEqual(response.status_code, 201, response.content)
+        create_strategy.assert_called_once_with(response.json()['id'])
+
+
+class _InlineThread:
+    """Stand-in for threading.Thread that runs the target on start()."""
+
+    def __init__(self, target, args=(), **kwargs):
+        self.target = target
+        self.args = args
+
+    def start(self):
+        self.target(*self.args)
+
+
+class UserErrorResponseTests(UserTestCase):
+    def test_server_error_hides_details_without_debug(self):
+        with patch('users.views.UserJsonStorageService.load_users', side_effect=RuntimeError('boom')), \
+                override_settings(DEBUG=False), self.assertLogs('users.views', level='ERROR'):
+            response = self.client.get('/api/users/')
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(response.json(), {'error': 'Internal server error'})
+
+    def test_server_error_includes_details_with_debug(self):
+        with patch('users.views.UserJsonStorageService.load_users', side_effect=RuntimeError('boom')), \
+                override_settings(DEBUG=True), self.assertLogs('users.views', level='ERROR'):
+            response = self.client.get('/api/users/')
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(response.json()['details'], 'boom')
+        self.assertEqual(response.json()['type'], 'RuntimeError')
+
+
+class UserDeleteTests(UserTestCase):
+    def test_delete_with_missing_picture_file(self):
+        user = User.objects.create(
+            name='Gone',
+            cpf='529.982.247-25',
+            account_provider='XP Investimentos',
+            account_number='12345-6',
+            picture='/media/users/does-not-exist.png',
+        )
+        with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+            response = self.client.delete(f'/api/users/{user.id}/')
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(User.objects.filter(id=user.id).exists())
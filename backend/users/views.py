@@ -1,79 +1,116 @@
 """
 Django REST Framework views for users.
 """
-import os
+import contextlib
+import logging
+import sys
+import threading
+import traceback
 from datetime import datetime
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
+from rest_framework.pagination import LimitOffsetPagination
+from django.conf import settings
 from django.core.files.storage import default_storage
-from django.core.files.base import ContentFile
+from django.db import connection, transaction
+from django.utils.cache import patch_cache_control
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
+from allocation_strategies.services import AllocationStrategyService
+from .models import User
+from .serializers import UserSerializer
 from .services import UserJsonStorageService
 
+logger = logging.getLogger(__name__)
+
+# Storage directory (relative to MEDIA_ROOT) for user pictures
+USERS_MEDIA_DIR = 'users/'
+
+
+def _not_found():
+    return Response({'error': 'User not found'}, status=status.HTTP_404_NOT_FOUND)
+
+
+def _validation_error(errors):
+    return Response({'error': 'Validation error', 'details': errors}, status=status.HTTP_400_BAD_REQUEST)
+
+
+def _server_error(exc_info):
+    """500 response; the traceback is only formatted when DEBUG is on."""
+    body = {'error': 'Internal server error'}
+    if settings.DEBUG:
+        exc_type, exc, _ = exc_info
+        body['details'] = str(exc)
+        body['type'] = exc_type.__name__
+        body['traceback'] = ''.join(traceback.format_exception(*exc_info)).split('\n')[-10:]
+    return Response(body, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+def _create_default_strategy(user_id):
+    """Create the default allocation strategy for a new user (runs in a background thread)."""
+    try:
+        AllocationStrategyService.create_default_strategy(User(id=user_id))
+    except Exception:
+        # Log error; user creation has already succeeded
+        logger.exception("Failed to create default allocation strategy for user %s", user_id)
+    finally:
+        connection.close()
+
+
+def _requested_user(request, user_id):
+    """The requested user (cached dict), looked up once per request."""
+    if not hasattr(request, '_requested_user'):
+        request._requested_user = UserJsonStorageService.get_user_by_id(user_id)
+    return request._requested_user
+
+
+def _user_etag(request, user_id):
+    user = _requested_user(request, user_id)
+    return user['updated_at'] if user else None
+
+
+def _user_last_modified(request, user_id):
+    user = _requested_user(request, user_id)
+    return datetime.fromisoformat(user['updated_at']) if user and user['updated_at'] else None
+
+
+class UserPagination(LimitOffsetPagination):
+    """Opt-in pagination: only applied when the client sends ?limit=."""
+    default_limit = None
+    max_limit = 500
+
 
 class UserListView(APIView):
     """List all users and create new users."""
     authentication_classes = []  # Disable authentication to bypass CSRF
+    pagination_class = UserPagination
     
     def get(self, request):
-        """Get all users."""
+        """Get all users (paginated when ?limit=&offset= are given)."""
         try:
+            paginator = self.pagination_class()
+            user_ids = paginator.paginate_queryset(
+                UserJsonStorageService.get_user_ids_queryset(), request, view=self
+            )
+            if user_ids is not None:
+                return paginator.get_paginated_response(
+                    UserJsonStorageService.get_users_by_ids(user_ids)
+                )
+            
             users = UserJsonStorageService.load_users()
-
-            # Ensure all data is JSON serializable
-            import json
-            try:
-                json.dumps(users)
-            except (TypeError, ValueError) as json_err:
-                print(f"ERROR: Data not JSON serializable: {json_err}")
-
-                def make_serializable(obj):
-                    if isinstance(obj, dict):
-                        return {k: make_serializable(v) for k, v in obj.items()}
-                    elif isinstance(obj, list):
-                        return [make_serializable(item) for item in obj]
-                    elif hasattr(obj, 'isoformat'):  # datetime objects
-                        return obj.isoformat()
-                    else:
-                        return str(obj)
-
-                users = make_serializable(users)
-
             return Response(users, status=status.HTTP_200_OK)
-        except Exception as e:
-            import traceback
-            error_details = traceback.format_exc()
-            error_msg = str(e)
-            print(f"ERROR loading users: {error_msg}")
-            print(f"ERROR traceback:\n{error_details}")
-            print("=" * 80)
-            print("ERROR IN UserListView.get():")
-            print(f"Error Type: {type(e).__name__}")
-            print(f"Error Message: {error_msg}")
-            print(f"Full Traceback:\n{error_details}")
-            print("=" * 80)
-
-            return Response(
-                {
-                    'error': 'Internal server error',
-                    'details': error_msg,
-                    'type': type(e).__name__,
-                    'traceback': error_details.split('\n')[-10:] if error_details else [],
-                },
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            )
+        except Exception:
+            logger.exception("Error loading users")
+            return _server_error(sys.exc_info())
     
     def post(self, request):
         """Create user."""
         try:
-            from .serializers import UserSerializer
             serializer = UserSerializer(data=request.data)
             
             if not serializer.is_valid():
-                return Response(
-                    {'error': 'Validation error', 'details': serializer.errors},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
+                return _validation_error(serializer.errors)
             
             # Generate user ID
             user_id = UserJsonStorageService.generate_user_id()
@@ -82,82 +119,52 @@ class UserListView(APIView):
             picture_path = None
             if 'picture' in request.FILES:
                 picture_file = request.FILES['picture']
-                file_extension = os.path.splitext(picture_file.name)[1]
                 picture_filename = f"{user_id}_{picture_file.name}"
-                picture_path = default_storage.save(
-                    f"users/{picture_filename}",
-                    ContentFile(picture_file.read())
-                )
+                picture_path = default_storage.save(USERS_MEDIA_DIR + picture_filename, picture_file)
             
-            # Create user object
-            user_data = {
+            # Create user (single-row insert)
+            user_data = UserJsonStorageService.create_user({
+                **serializer.validated_data,
                 'id': user_id,
-                'name': serializer.validated_data['name'],
-                'cpf': serializer.validated_data['cpf'],
-                'account_provider': serializer.validated_data['account_provider'],
-                'account_number': serializer.validated_data['account_number'],
                 'picture': f"/media/{picture_path}" if picture_path else None,
-                'created_at': datetime.now().isoformat(),
-                'updated_at': datetime.now().isoformat(),
-            }
-            
-            # Save to JSON file
-            users = UserJsonStorageService.load_users()
-            users.append(user_data)
-            UserJsonStorageService.save_users(users)
+            })
             
-            # Create default allocation strategy for new user
-            try:
-                from users.models import User as UserModel
-                from allocation_strategies.services import AllocationStrategyService
-                user_obj = UserModel.objects.get(id=user_id)
-                AllocationStrategyService.create_default_strategy(user_obj)
-            except Exception as e:
-                # Log error but don't fail user creation if strategy creation fails
-                import traceback
-                print(f"Warning: Failed to create default allocation strategy for user {user_id}: {e}")
-                print(traceback.format_exc())
+            # Create default allocation strategy for new user off the request path
+            transaction.on_commit(lambda: threading.Thread(
+                target=_create_default_strategy, args=(user_id,), daemon=True,
+            ).start())
             
             return Response(user_data, status=status.HTTP_201_CREATED)
-        except Exception as e:
-            import traceback
-            error_details = traceback.format_exc()
-            print(f"Error creating user: {e}")
-            print(error_details)
-            return Response(
-                {'error': 'Internal server error', 'details': str(e)},
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR
-            )
+        except Exception:
+            logger.exception("Error creating user")
+            return _server_error(sys.exc_info())
 
 
 class UserDetailView(APIView):
     """Get, update, or delete a user."""
     authentication_classes = []  # Disable authentication to bypass CSRF
     
+    @method_decorator(condition(etag_func=_user_etag, last_modified_func=_user_last_modified))
     def get(self, request, user_id):
-        """Get user by ID."""
-        user = UserJsonStorageService.get_user_by_id(user_id)
+        """Get user by ID (answers 304 when If-None-Match/If-Modified-Since still match)."""
+        user = _requested_user(request, user_id)
         
         if not user:
-            return Response(
-                {'error': 'User not found'},
-                status=status.HTTP_404_NOT_FOUND
-            )
+            return _not_found()
         
-        return Response(user, status=status.HTTP_200_OK)
+        response = Response(user, status=status.HTTP_200_OK)
+        # Clients may keep the body but must revalidate, so edits show up immediately
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
     
     def put(self, request, user_id):
         """Update user."""
         user = UserJsonStorageService.get_user_by_id(user_id)
         
         if not user:
-            return Response(
-                {'error': 'User not found'},
-                status=status.HTTP_404_NOT_FOUND
-            )
+            return _not_found()
         
         # Create serializer with existing data and context to exclude current user from uniqueness checks
-        from .serializers import UserSerializer
         serializer = UserSerializer(
             data=request.data, 
             partial=True,
@@ -165,60 +172,43 @@ class UserDetailView(APIView):
         )
         
         if not serializer.is_valid():
-            return Response(
-                {'error': 'Validation error', 'details': serializer.errors},
-                status=status.HTTP_400_BAD_REQUEST
-            )
+            return _validation_error(serializer.errors)
         
         # Update fields
-        for field in ['name', 'cpf', 'account_provider', 'account_number']:
-            if field in serializer.validated_data:
-                user[field] = serializer.validated_data[field]
+        # The uploaded file itself is never stored; its saved path is set below
+        changes = dict(serializer.validated_data)
+        changes.pop('picture', None)
         
         # Handle picture update
         if 'picture' in request.FILES:
             # Delete old picture if exists
             if user.get('picture'):
-                old_path = user['picture'].replace('/media/', '')
-                if default_storage.exists(old_path):
-                    default_storage.delete(old_path)
+                with contextlib.suppress(FileNotFoundError):
+                    default_storage.delete(user['picture'].removeprefix('/media/'))
             
             # Save new picture
             picture_file = request.FILES['picture']
-            file_extension = os.path.splitext(picture_file.name)[1]
             picture_filename = f"{user_id}_{picture_file.name}"
-            picture_path = default_storage.save(
-                f"users/{picture_filename}",
-                ContentFile(picture_file.read())
-            )
-            user['picture'] = f"/media/{picture_path}"
+            picture_path = default_storage.save(USERS_MEDIA_DIR + picture_filename, picture_file)
+            changes['picture'] = f"/media/{picture_path}"
         
-        user['updated_at'] = datetime.now().isoformat()
-        
-        # Save to JSON file
-        users = UserJsonStorageService.load_users()
-        users = [u if u.get('id') != user_id else user for u in users]
-        UserJsonStorageService.save_users(users)
+        # Save (single-row update)
+        user = UserJsonStorageService.update_user(user_id, changes)
+        if not user:
+            return _not_found()
         
         return Response(user, status=status.HTTP_200_OK)
     
     def delete(self, request, user_id):
         """Delete user."""
-        from .models import User
-        
-        try:
-            user = User.objects.get(id=user_id)
-        except User.DoesNotExist:
-            return Response(
-                {'error': 'User not found'},
-                status=status.HTTP_404_NOT_FOUND
-            )
+        user = User.objects.filter(id=UserJsonStorageService.parse_user_id(user_id)).first()
+        if user is None:
+            return _not_found()
         
         # Delete picture file if exists
         if user.picture:
-            picture_path = user.picture.replace('/media/', '')
-            if default_storage.exists(picture_path):
-                default_storage.delete(picture_path)
+            with contextlib.suppress(FileNotFoundError):
+                default_storage.delete(user.picture.removeprefix('/media/'))
         
         # Delete from database
         user.delete()
@@ -2,155 +2,217 @@
 Script to calculate the total value of rebalancing recommendations
 using actual current prices vs. Stocks in Reals recommendations.
 """
+import sys
 import requests
-import json
-from decimal import Decimal
+from dataclasses import dataclass
+from functools import lru_cache
+
+try:
+    import orjson
+except ImportError:  # Fall back to the stdlib json module
+    orjson = None
 
 # API base URL
 API_BASE = "http://localhost:8000/api"
 
+# Shared session: keep-alive reuses the connection across API calls
+SESSION = requests.Session()
+
+# Row template for the buy/sell details tables (bound format_map, built once)
+DETAIL_ROW = "   {ticker:8s} | {action:20s} | Preço: R$ {price:8.2f} | Valor: R$ {value:10.2f} | {type}".format_map
+
 # User ID (Aurelio Avanzi)
 USER_ID = "024.537.739-50"
 
+def load_json(response):
+    """Decode a JSON response body (with orjson when it is installed)."""
+    return orjson.loads(response.content) if orjson else response.json()
+
+@lru_cache(maxsize=256)
 def get_latest_recommendation(user_id):
-    """Get the latest rebalancing recommendation for a user."""
-    response = requests.get(f"{API_BASE}/rebalancing-recommendations/", params={"user_id": user_id})
+    """Get the latest rebalancing recommendation for a user (cached per run; do not mutate)."""
+    response = SESSION.get(f"{API_BASE}/rebalancing-recommendations/", params={"user_id": user_id})
     if response.status_code == 200:
-        recommendations = response.json()
+        recommendations = load_json(response)
         if recommendations:
             # Get the most recent recommendation
             latest = max(recommendations, key=lambda x: x.get('recommendation_date', ''))
             return latest
     return None
 
-def get_stock_current_price(ticker):
-    """Get current price for a stock ticker."""
-    response = requests.get(f"{API_BASE}/stocks/", params={"ticker": ticker, "is_active": "true"})
+def get_stocks_bulk(tickers):
+    """Get current prices for many stock tickers in a single request."""
+    if not tickers:
+        return {}
+    response = SESSION.get(f"{API_BASE}/stocks/", params={
+        "tickers": ",".join(tickers),
+        "active_only": "true",
+        "exclude_fiis": "false",
+    })
     if response.status_code == 200:
-        stocks = response.json()
-        if stocks:
-            stock = stocks[0]
-            return Decimal(str(stock.get('current_price', 0)))
-    return Decimal('0')
-
-def calculate_recommendation_totals(recommendation):
-    """Calculate total buy and sell values using current prices."""
-    actions = recommendation.get('actions', [])
-    
-    total_buys = Decimal('0')
-    total_sells = Decimal('0')
-    total_buys_reais = Decimal('0')
-    total_sells_reais = Decimal('0')
-    total_buys_dolares = Decimal('0')
-    total_buys_crypto = Decimal('0')
-    
-    buy_details = []
-    sell_details = []
+        return {
+            stock['ticker']: float(stock.get('current_price') or 0)
+            for stock in load_json(response)
+        }
+    return {}
+
+@lru_cache(maxsize=256)
+def get_stock_current_price(ticker):
+    """Get current price for a stock ticker (cached per run)."""
+    return get_stocks_bulk([ticker]).get(ticker, 0.0)
+
+def get_recommendation_tickers(recommendation):
+    """Collect the distinct stock tickers referenced by a recommendation's actions."""
+    return sorted({
+        action['stock']['ticker']
+        for action in recommendation.get('actions', [])
+        if action.get('stock') and action['stock'].get('ticker')
+    })
+
+def _action_side(action_type, difference):
+    """Classify an action once: 1 for a buy, -1 for a sell, 0 for neither."""
+    if action_type == 'buy' or (action_type == 'rebalance' and difference > 0):
+        return 1
+    if action_type == 'sell' or (action_type == 'rebalance' and difference < 0):
+        return -1
+    return 0
+
+@dataclass(slots=True)
+class ActionRow:
+    """One recommendation action, read out of the API payload once."""
+    side: int            # 1 buy, -1 sell, 0 neither (see _action_side)
+    is_stock: bool
+    ticker: str | None
+    price: float
+    qty_buy: float | None
+    qty_sell: float | None
+    diff: float
+    is_bdr: bool
+    is_reais: bool
+    is_crypto: bool
+    crypto_symbol: str
     
-    for action in actions:
-        action_type = action.get('action_type')
-        stock = action.get('stock')
-        difference = Decimal(str(action.get('difference', 0)))
-        quantity_to_buy = action.get('quantity_to_buy')
-        quantity_to_sell = action.get('quantity_to_sell')
-        current_value = Decimal(str(action.get('current_value', 0)))
+    @classmethod
+    def from_action(cls, action, prices):
+        difference = float(action.get('difference') or 0)
         investment_subtype = action.get('investment_subtype')
-        subtype_name = investment_subtype.get('name', '') if investment_subtype else ''
+        subtype_name = (investment_subtype.get('name') or '') if investment_subtype else ''
+        stock = action.get('stock')
         
+        is_bdr = is_reais = is_crypto = False
+        ticker = None
+        price = 0.0
         if stock:
             ticker = stock.get('ticker')
-            current_price = Decimal(str(stock.get('current_price', 0)))
-            
+            price = prices.get(ticker)
+            if price is None:
+                price = float(stock.get('current_price') or 0)
             # Determine if this is "Ações em Reais" or "BDRs"
-            is_bdr = 'BDR' in subtype_name.upper() if subtype_name else False
-            is_acoes_reais = not is_bdr and stock.get('investment_type', {}).get('code') == 'RENDA_VARIAVEL_REAIS'
-            
-            if action_type == 'buy' or (action_type == 'rebalance' and difference > 0):
-                if quantity_to_buy and quantity_to_buy > 0:
-                    buy_value = current_price * Decimal(str(quantity_to_buy))
-                    total_buys += buy_value
-                    
-                    if is_acoes_reais:
-                        total_buys_reais += buy_value
-                    elif is_bdr:
-                        total_buys_dolares += buy_value
-                    
-                    buy_details.append({
-                        'ticker': ticker,
-                        'action': f'Comprar {quantity_to_buy}',
-                        'price': float(current_price),
-                        'value': float(buy_value),
-                        'type': 'Ações em Reais' if is_acoes_reais else 'BDRs'
-                    })
-                elif difference > 0:
-                    # Use difference as buy value
-                    total_buys += difference
-                    if is_acoes_reais:
-                        total_buys_reais += difference
-                    elif is_bdr:
-                        total_buys_dolares += difference
-                    
-                    buy_details.append({
-                        'ticker': ticker,
-                        'action': f'Comprar (diff: {difference})',
-                        'price': float(current_price),
-                        'value': float(difference),
-                        'type': 'Ações em Reais' if is_acoes_reais else 'BDRs'
-                    })
-            
-            elif action_type == 'sell' or (action_type == 'rebalance' and difference < 0):
-                if quantity_to_sell and quantity_to_sell > 0:
-                    sell_value = current_price * Decimal(str(abs(quantity_to_sell)))
-                    total_sells += sell_value
-                    
-                    if is_acoes_reais:
-                        total_sells_reais += sell_value
-                    
-                    sell_details.append({
-                        'ticker': ticker,
-                        'action': f'Vender {abs(quantity_to_sell)}',
-                        'price': float(current_price),
-                        'value': float(sell_value),
-                        'type': 'Ações em Reais'
-                    })
-                elif difference < 0:
-                    # Use absolute difference as sell value
-                    sell_value = abs(difference)
-                    total_sells += sell_value
-                    if is_acoes_reais:
-                        total_sells_reais += sell_value
-                    
-                    sell_details.append({
-                        'ticker': ticker,
-                        'action': f'Vender (diff: {abs(difference)})',
-                        'price': float(current_price),
-                        'value': float(sell_value),
-                        'type': 'Ações em Reais'
-                    })
+            is_bdr = 'BDR' in subtype_name.upper()
+            investment_type_code = (stock.get('investment_type') or {}).get('code')
+            is_reais = not is_bdr and investment_type_code == 'RENDA_VARIAVEL_REAIS'
+        else:
+            subtype_lower = subtype_name.lower()
+            is_crypto = 'crypto' in subtype_lower or 'cripto' in subtype_lower
+        
+        return cls(
+            side=_action_side(action.get('action_type'), difference),
+            is_stock=bool(stock),
+            ticker=ticker,
+            price=price,
+            qty_buy=action.get('quantity_to_buy'),
+            qty_sell=action.get('quantity_to_sell'),
+            diff=difference,
+            is_bdr=is_bdr,
+            is_reais=is_reais,
+            is_crypto=is_crypto,
+            crypto_symbol=action.get('crypto_currency_symbol', 'Crypto'),
+        )
+
+# Per side: action verb, grand-total key, "Ações em Reais" key, BDR key (sells have none)
+_SIDE_TOTALS = {
+    1: ('Comprar', 'total_buys', 'total_buys_reais', 'total_buys_dolares'),
+    -1: ('Vender', 'total_sells', 'total_sells_reais', None),
+}
+
+def _accumulate(row, totals, details):
+    """Add one stock buy (row.side=1) or sell (row.side=-1) to the totals and details.
+    
+    details may be None when the caller only wants the totals.
+    """
+    side = row.side
+    verb, total_key, reais_key, bdr_key = _SIDE_TOTALS[side]
+    qty = row.qty_buy if side > 0 else row.qty_sell
+    if qty and qty > 0:
+        value = row.price * qty
+    elif row.diff * side > 0:
+        # Use the (absolute) difference as the value
+        value = abs(row.diff)
+        qty = None
+    else:
+        return
+    
+    totals[total_key] += value
+    if row.is_reais:
+        totals[reais_key] += value
+    elif row.is_bdr and bdr_key:
+        totals[bdr_key] += value
+    
+    if details is None:
+        return
+    details.append({
+        'ticker': row.ticker,
+        'action': f'{verb} {qty}' if qty else f'{verb} (diff: {value:.2f})',
+        'price': row.price,
+        'value': value,
+        'type': 'Ações em Reais' if row.is_reais or side < 0 else 'BDRs'
+    })
+
+def calculate_recommendation_totals(recommendation, prices=None, *, details=True):
+    """Calculate total buy and sell values using current prices.
+    
+    prices maps ticker -> current price (see get_stocks_bulk); tickers missing
+    from it fall back to the price embedded in the action's stock. Pass
+    details=False to skip building buy_details/sell_details (returned empty).
+    """
+    prices = prices or {}
+    rows = [ActionRow.from_action(action, prices) for action in recommendation.get('actions', [])]
+    
+    totals = {
+        'total_buys': 0.0,
+        'total_sells': 0.0,
+        'total_buys_reais': 0.0,
+        'total_sells_reais': 0.0,
+        'total_buys_dolares': 0.0,
+        'total_buys_crypto': 0.0,
+    }
+    
+    buy_details = []
+    sell_details = []
+    
+    for row in rows:
+        if row.is_stock:
+            if row.side:
+                side_details = buy_details if row.side > 0 else sell_details
+                _accumulate(row, totals, side_details if details else None)
         
         # Handle crypto
-        elif not stock and ('crypto' in subtype_name.lower() or 'cripto' in subtype_name.lower()):
-            if difference > 0:
-                total_buys_crypto += difference
+        elif row.is_crypto and row.diff > 0:
+            totals['total_buys_crypto'] += row.diff
+            if details:
                 buy_details.append({
                     'ticker': 'BTC',
-                    'action': action.get('crypto_currency_symbol', 'Crypto'),
+                    'action': row.crypto_symbol,
                     'price': 0,
-                    'value': float(difference),
+                    'value': row.diff,
                     'type': 'Cripto'
                 })
     
-    return {
-        'total_buys': float(total_buys),
-        'total_sells': float(total_sells),
-        'total_buys_reais': float(total_buys_reais),
-        'total_sells_reais': float(total_sells_reais),
-        'total_buys_dolares': float(total_buys_dolares),
-        'total_buys_crypto': float(total_buys_crypto),
-        'net_flow': float(total_buys - total_sells),
-        'buy_details': buy_details,
-        'sell_details': sell_details
-    }
+    result = {key: round(value, 2) for key, value in totals.items()}
+    result['net_flow'] = round(totals['total_buys'] - totals['total_sells'], 2)
+    result['buy_details'] = buy_details
+    result['sell_details'] = sell_details
+    return result
 
 def main():
     print("=" * 80)
@@ -173,56 +235,63 @@ def main():
     
     # Calculate totals
     print("Calculando totais usando preços atuais...")
-    totals = calculate_recommendation_totals(recommendation)
+    prices = get_stocks_bulk(get_recommendation_tickers(recommendation))
+    totals = calculate_recommendation_totals(recommendation, prices)
     
-    print()
-    print("=" * 80)
-    print("RESUMO DA RECOMENDAÇÃO")
-    print("=" * 80)
-    print()
+    # Build the report, then write it out at once
+    lines = []
+    lines.append("")
+    lines.append("=" * 80)
+    lines.append("RESUMO DA RECOMENDAÇÃO")
+    lines.append("=" * 80)
+    lines.append("")
     
-    print("📊 COMPRAS:")
-    print(f"   Total Geral: R$ {totals['total_buys']:,.2f}")
-    print(f"   - Ações em Reais: R$ {totals['total_buys_reais']:,.2f}")
-    print(f"   - BDRs: R$ {totals['total_buys_dolares']:,.2f}")
-    print(f"   - Cripto: R$ {totals['total_buys_crypto']:,.2f}")
-    print()
+    lines.append("📊 COMPRAS:")
+    lines.append(f"   Total Geral: R$ {totals['total_buys']:,.2f}")
+    lines.append(f"   - Ações em Reais: R$ {totals['total_buys_reais']:,.2f}")
+    lines.append(f"   - BDRs: R$ {totals['total_buys_dolares']:,.2f}")
+    lines.append(f"   - Cripto: R$ {totals['total_buys_crypto']:,.2f}")
+    lines.append("")
     
-    print("💰 VENDAS:")
-    print(f"   Total Geral: R$ {totals['total_sells']:,.2f}")
-    print(f"   - Ações em Reais: R$ {totals['total_sells_reais']:,.2f}")
-    print()
+    lines.append("💰 VENDAS:")
+    lines.append(f"   Total Geral: R$ {totals['total_sells']:,.2f}")
+    lines.append(f"   - Ações em Reais: R$ {totals['total_sells_reais']:,.2f}")
+    lines.append("")
     
-    print("📈 FLUXO LÍQUIDO:")
-    print(f"   Total: R$ {totals['net_flow']:,.2f}")
-    print(f"   (Compras - Vendas)")
-    print()
+    lines.append("📈 FLUXO LÍQUIDO:")
+    lines.append(f"   Total: R$ {totals['net_flow']:,.2f}")
+    lines.append(f"   (Compras - Vendas)")
+    lines.append("")
     
-    print("=" * 80)
-    print("DETALHES DAS COMPRAS")
-    print("=" * 80)
-    for detail in totals['buy_details']:
-        print(f"   {detail['ticker']:8s} | {detail['action']:20s} | Preço: R$ {detail['price']:8.2f} | Valor: R$ {detail['value']:10.2f} | {detail['type']}")
+    lines.append("=" * 80)
+    lines.append("DETALHES DAS COMPRAS")
+    lines.append("=" * 80)
+    lines.extend(map(DETAIL_ROW, totals['buy_details']))
     
-    print()
-    print("=" * 80)
-    print("DETALHES DAS VENDAS")
-    print("=" * 80)
-    for detail in totals['sell_details']:
-        print(f"   {detail['ticker']:8s} | {detail['action']:20s} | Preço: R$ {detail['price']:8.2f} | Valor: R$ {detail['value']:10.2f} | {detail['type']}")
+    lines.append("")
+    lines.append("=" * 80)
+    lines.append("DETALHES DAS VENDAS")
+    lines.append("=" * 80)
+    lines.extend(map(DETAIL_ROW, totals['sell_details']))
     
-    print()
-    print("=" * 80)
-    print("INFORMAÇÕES DA RECOMENDAÇÃO")
-    print("=" * 80)
-    print(f"   Vendas Já Realizadas no Mês: R$ {recommendation.get('previous_sales_this_month', 0):,.2f}")
-    print(f"   Limite Disponível para Vendas: R$ {recommendation.get('sales_limit_remaining', 0):,.2f}")
-    print(f"   Total Vendas na Recomendação: R$ {recommendation.get('total_sales_value', 0):,.2f}")
-    print(f"   Vendas Completas: R$ {recommendation.get('total_complete_sales_value', 0):,.2f}")
-    print(f"   Vendas Parciais: R$ {recommendation.get('total_partial_sales_value', 0):,.2f}")
+    lines.append("")
+    lines.append("=" * 80)
+    lines.append("INFORMAÇÕES DA RECOMENDAÇÃO")
+    lines.append("=" * 80)
+    lines.append(f"   Vendas Já Realizadas no Mês: R$ {recommendation.get('previous_sales_this_month', 0):,.2f}")
+    lines.append(f"   Limite Disponível para Vendas: R$ {recommendation.get('sales_limit_remaining', 0):,.2f}")
+    lines.append(f"   Total Vendas na Recomendação: R$ {recommendation.get('total_sales_value', 0):,.2f}")
+    lines.append(f"   Vendas Completas: R$ {recommendation.get('total_complete_sales_value', 0):,.2f}")
+    lines.append(f"   Vendas Parciais: R$ {recommendation.get('total_partial_sales_value', 0):,.2f}")
+    
+    # Emit the whole report with a single write
+    sys.stdout.write("\n".join(lines) + "\n")
 
 if __name__ == "__main__":
-    main()
+    try:
+        main()
+    finally:
+        SESSION.close()
 
 
 
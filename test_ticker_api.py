@@ -4,20 +4,42 @@ Test script for ticker mappings API
 import requests
 import json
 import sys
+from pathlib import Path
+
+try:
+    import orjson
+except ImportError:  # Fall back to the stdlib json module
+    orjson = None
 
 BASE_URL = "http://localhost:8000/api/ticker-mappings"
 
+# Shared session: keep-alive reuses the connection across API calls
+SESSION = requests.Session()
+
+# Last parsed ticker.json, keyed by its (mtime, size) so unchanged files are not re-read
+_ticker_cache = {'stamp': None, 'data': None}
+
+def load_json(response):
+    """Decode a JSON response body (with orjson when it is installed)."""
+    return orjson.loads(response.content) if orjson else response.json()
+
+def dumps_pretty(data):
+    """Pretty-print data as indented JSON (with orjson when it is installed)."""
+    if orjson:
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2).decode()
+    return json.dumps(data, indent=2)
+
 def test_get_all_mappings():
     """Test GET /api/ticker-mappings/"""
     print("=" * 60)
     print("TEST 1: GET all ticker mappings")
     print("=" * 60)
     try:
-        response = requests.get(f"{BASE_URL}/")
+        response = SESSION.get(f"{BASE_URL}/")
         print(f"Status Code: {response.status_code}")
         print(f"Response: {response.text}")
         if response.status_code == 200:
-            data = response.json()
+            data = load_json(response)
             print(f"✅ Success! Found {len(data)} mappings")
             return True
         else:
@@ -37,9 +59,9 @@ def test_create_mapping(nome, ticker):
             "nome": nome,
             "ticker": ticker
         }
-        response = requests.post(f"{BASE_URL}/", json=payload)
+        response = SESSION.post(f"{BASE_URL}/", json=payload)
         print(f"Status Code: {response.status_code}")
-        print(f"Response: {json.dumps(response.json(), indent=2)}")
+        print(f"Response: {dumps_pretty(load_json(response))}")
         if response.status_code == 201:
             print("✅ Success! Mapping created")
             return True
@@ -59,9 +81,9 @@ def test_get_specific_mapping(nome):
         # URL encode the nome
         import urllib.parse
         encoded_nome = urllib.parse.quote(nome)
-        response = requests.get(f"{BASE_URL}/{encoded_nome}")
+        response = SESSION.get(f"{BASE_URL}/{encoded_nome}")
         print(f"Status Code: {response.status_code}")
-        print(f"Response: {json.dumps(response.json(), indent=2)}")
+        print(f"Response: {dumps_pretty(load_json(response))}")
         if response.status_code == 200:
             print("✅ Success! Mapping found")
             return True
@@ -72,22 +94,31 @@ def test_get_specific_mapping(nome):
         print(f"❌ Error: {e}")
         return False
 
+def load_ticker_file(file_path):
+    """Parse ticker.json, reusing the last result while the file is unchanged."""
+    st = file_path.stat()
+    stamp = (st.st_mtime_ns, st.st_size)
+    if _ticker_cache['stamp'] != stamp:
+        if orjson:
+            data = orjson.loads(file_path.read_bytes())
+        else:
+            data = json.loads(file_path.read_text(encoding='utf-8'))
+        _ticker_cache.update(stamp=stamp, data=data)
+    return _ticker_cache['data']
+
 def check_file_exists():
     """Check if ticker.json file exists"""
     print("\n" + "=" * 60)
     print("TEST 4: Check if ticker.json file exists")
     print("=" * 60)
-    import os
-    from pathlib import Path
     
     file_path = Path("backend/data/ticker.json")
     if file_path.exists():
         print(f"✅ File exists at: {file_path.absolute()}")
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
+            data = load_ticker_file(file_path)
             print(f"✅ File contains {len(data)} mappings:")
-            print(json.dumps(data, indent=2))
+            print(dumps_pretty(data))
             return True
         except Exception as e:
             print(f"❌ Error reading file: {e}")
@@ -97,45 +128,46 @@ def check_file_exists():
         return False
 
 if __name__ == "__main__":
-    print("\n🧪 Testing Ticker Mappings API\n")
-    
-    # Test 1: Get all mappings (should be empty initially)
-    test1 = test_get_all_mappings()
+    try:
+        print("\n🧪 Testing Ticker Mappings API\n")
     
-    # Test 2: Create a mapping
-    test2 = test_create_mapping("PETROBRAS ON NM", "PETR4")
+        # Test 1: Get all mappings (should be empty initially)
+        test1 = test_get_all_mappings()
     
-    # Check if file was created
-    test4 = check_file_exists()
+        # Test 2: Create a mapping
+        test2 = test_create_mapping("PETROBRAS ON NM", "PETR4")
     
-    # Test 3: Get all mappings again (should have 1 now)
-    test1b = test_get_all_mappings()
+        # Check if file was created
+        test4 = check_file_exists()
     
-    # Test 4: Get specific mapping
-    test3 = test_get_specific_mapping("PETROBRAS ON NM")
+        # Test 3: Get all mappings again (should have 1 now)
+        test1b = test_get_all_mappings()
     
-    # Test 5: Create another mapping
-    test5 = test_create_mapping("VALE ON NM", "VALE3")
+        # Test 4: Get specific mapping
+        test3 = test_get_specific_mapping("PETROBRAS ON NM")
     
-    # Check file again
-    test4b = check_file_exists()
+        # Test 5: Create another mapping
+        test5 = test_create_mapping("VALE ON NM", "VALE3")
     
-    # Summary
-    print("\n" + "=" * 60)
-    print("TEST SUMMARY")
-    print("=" * 60)
-    print(f"GET all (initial): {'✅ PASS' if test1 else '❌ FAIL'}")
-    print(f"POST create (PETR4): {'✅ PASS' if test2 else '❌ FAIL'}")
-    print(f"File created: {'✅ PASS' if test4 else '❌ FAIL'}")
-    print(f"GET all (after): {'✅ PASS' if test1b else '❌ FAIL'}")
-    print(f"GET specific: {'✅ PASS' if test3 else '❌ FAIL'}")
-    print(f"POST create (VALE3): {'✅ PASS' if test5 else '❌ FAIL'}")
-    print(f"File updated: {'✅ PASS' if test4b else '❌ FAIL'}")
+        # Check file again
+        test4b = check_file_exists()
     
-    if all([test1, test2, test4, test1b, test3, test5, test4b]):
-        print("\n🎉 All tests passed!")
-        sys.exit(0)
-    else:
-        print("\n⚠️ Some tests failed. Check the output above.")
-        sys.exit(1)
-
+        # Summary (written out at once)
+        all_passed = all([test1, test2, test4, test1b, test3, test5, test4b])
+        summary = [
+            "\n" + "=" * 60,
+            "TEST SUMMARY",
+            "=" * 60,
+            f"GET all (initial): {'✅ PASS' if test1 else '❌ FAIL'}",
+            f"POST create (PETR4): {'✅ PASS' if test2 else '❌ FAIL'}",
+            f"File created: {'✅ PASS' if test4 else '❌ FAIL'}",
+            f"GET all (after): {'✅ PASS' if test1b else '❌ FAIL'}",
+            f"GET specific: {'✅ PASS' if test3 else '❌ FAIL'}",
+            f"POST create (VALE3): {'✅ PASS' if test5 else '❌ FAIL'}",
+            f"File updated: {'✅ PASS' if test4b else '❌ FAIL'}",
+            "\n🎉 All tests passed!" if all_passed else "\n⚠️ Some tests failed. Check the output above.",
+        ]
+        sys.stdout.write("\n".join(summary) + "\n")
+        sys.exit(0 if all_passed else 1)
+    finally:
+        SESSION.close()